@@ -1,87 +1,42 @@
 from datetime import datetime
-import sqlite3
 import os
 from flask import Flask, render_template, request, redirect, url_for, session, jsonify
 from werkzeug.security import generate_password_hash, check_password_hash
 
+import maintenance
+import storage
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = os.path.join(BASE_DIR, 'data.db')
+DB_PATH = os.environ.get('DB_PATH', os.path.join(BASE_DIR, 'data.db'))
+BACKUP_DIR = os.environ.get('BACKUP_DIR', os.path.join(BASE_DIR, 'backups'))
 
 app = Flask(__name__, template_folder='templates')
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key')
-
-
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+app.config.update(
+    STORAGE_BACKEND=os.environ.get('STORAGE_BACKEND', 'sqlite'),
+    DB_PATH=DB_PATH,
+    DATABASE_URL=os.environ.get('DATABASE_URL'),
+    DB_POOL_MIN=int(os.environ.get('DB_POOL_MIN', '1')),
+    DB_POOL_MAX=int(os.environ.get('DB_POOL_MAX', '10')),
+    SHARD_DIR=os.environ.get('SHARD_DIR', os.path.join(BASE_DIR, 'shards')),
+    CENTRAL_DB_PATH=os.environ.get('CENTRAL_DB_PATH'),
+    SHARD_BUCKETS=int(os.environ.get('SHARD_BUCKETS', '0')),
+    SHARD_MAX_OPEN=int(os.environ.get('SHARD_MAX_OPEN', '64')),
+)
+
+# All task/project/user SQL lives behind this repository (see storage/)
+repo = storage.create_repository(app.config)
+
+# idle-time maintenance; backups and PRAGMA jobs cover repo.database_files()
+# (data.db, or users.db plus every shard; nothing for PostgreSQL)
+MAINTENANCE_ENABLED = os.environ.get('MAINTENANCE_ENABLED', '1') != '0'
+# requests that don't count as traffic: a frequent uptime probe would
+# otherwise keep the app "busy" and hold every job back
+MAINTENANCE_IGNORED_ENDPOINTS = ('health', 'maintenance_status', 'static')
 
 
 def init_db():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        '''
-        CREATE TABLE IF NOT EXISTS tasks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            project TEXT,
-            title TEXT NOT NULL,
-            description TEXT,
-            priority TEXT,
-            due TEXT,
-            due_sort TEXT,
-            status TEXT DEFAULT 'todo'
-        )
-        '''
-    )
-    # projects table to persist project metadata
-    cur.execute(
-        '''
-        CREATE TABLE IF NOT EXISTS projects (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user TEXT NOT NULL,
-            name TEXT NOT NULL,
-            description TEXT,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(user, name)
-        )
-        '''
-    )
-    # users table for authentication
-    cur.execute(
-        '''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email TEXT NOT NULL UNIQUE,
-            password_hash TEXT NOT NULL,
-            first_name TEXT,
-            last_name TEXT,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP
-        )
-        '''
-    )
-    conn.commit()
-    # Add completed_at column if it doesn't exist (safe on repeated runs)
-    try:
-        cur.execute("ALTER TABLE tasks ADD COLUMN completed_at TEXT")
-        conn.commit()
-    except Exception:
-        # column already exists or other issue; ignore
-        pass
-    # Add user column for per-user ownership (non-destructive)
-    try:
-        cur.execute("ALTER TABLE tasks ADD COLUMN user TEXT")
-        conn.commit()
-    except Exception:
-        pass
-    # Add user column to projects table if missing (safe on repeated runs)
-    try:
-        cur.execute("ALTER TABLE projects ADD COLUMN user TEXT")
-        conn.commit()
-    except Exception:
-        # column already exists or other issue; ignore
-        pass
-    conn.close()
+    repo.init_schema()
 
 
 @app.context_processor
@@ -93,54 +48,23 @@ def inject_globals():
 try:
     init_db()
 except Exception:
-    pass
-
-# Projects are persisted in the `projects` table in SQLite (see init_db)
+    # keep importing (the CLI may be about to fix the config), but say why
+    app.logger.exception('could not initialize the database schema')
 
 
 def load_all_tasks(user=None):
     """Load tasks from the DB. If `user` is provided, return only that user's tasks."""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    if user:
-        cur.execute('SELECT * FROM tasks WHERE user = ? ORDER BY COALESCE(due_sort, "") ASC, priority DESC', (user,))
-    else:
-        cur.execute('SELECT * FROM tasks ORDER BY COALESCE(due_sort, "") ASC, priority DESC')
-    rows = cur.fetchall()
-    tasks = []
-    for r in rows:
-        tasks.append({
-            'id': r['id'],
-            'project': r['project'] or 'Genel',
-            'title': r['title'],
-            'description': r['description'] or '',
-            'priority': r['priority'] or 'medium',
-            'due': r['due'] or '',
-            'due_sort': r['due_sort'] or '',
-            'status': r['status'] or 'todo',
-            'completed_at': r['completed_at'] or '',
-            'user': r['user'] if 'user' in r.keys() else None
-        })
-    conn.close()
-    return tasks
+    return repo.list_tasks(user=user)
 
 
 @app.route('/')
 def index():
-    conn = get_db_connection()
-    cur = conn.cursor()
     # Show stats only for the logged-in user
     user = session.get('user')
-    if user:
-        cur.execute("SELECT status, COUNT(*) as cnt FROM tasks WHERE user = ? GROUP BY status", (user,))
-    else:
-        cur.execute("SELECT status, COUNT(*) as cnt FROM tasks GROUP BY status")
-    rows = cur.fetchall()
-    stats = {r['status']: r['cnt'] for r in rows}
+    stats = repo.task_status_counts(user=user)
     today_tasks = stats.get('todo', 0)
     this_week = stats.get('done', 0)
     upcoming = stats.get('in_progress', 0)
-    conn.close()
     data = {
         'user_name': session.get('user', 'Arnis'),
         'today_tasks': today_tasks,
@@ -153,8 +77,10 @@ def index():
 @app.route('/tasks')
 def tasks():
     user = session.get('user')
+    # read the cursor first: anything written after it shows up in the next sync
+    sync_cursor = repo.current_change_seq(user)
     tasks = load_all_tasks(user=user)
-    return render_template('tasks.html', user_name=session.get('user', 'Arnis'), tasks=tasks)
+    return render_template('tasks.html', user_name=session.get('user', 'Arnis'), tasks=tasks, sync_cursor=sync_cursor)
 
 
 @app.route('/add_task', methods=['POST'])
@@ -174,14 +100,20 @@ def add_task():
         except Exception:
             due_display = due_sort
     user = session.get('user')
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        'INSERT INTO tasks (project, title, description, priority, due, due_sort, status, user) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
-        (project, title, description, priority, due_display or due_sort, due_sort, 'todo', user)
-    )
-    conn.commit()
-    conn.close()
+    task_id = repo.add_task(user, project, title, description, priority, due_display or due_sort, due_sort)
+
+    # fetch() callers get the new task back and insert the card themselves
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({'ok': True, 'task': {
+            'id': task_id,
+            'project': project,
+            'title': title,
+            'description': description,
+            'priority': priority,
+            'due': due_display or due_sort,
+            'due_sort': due_sort,
+            'status': 'todo',
+        }})
 
     # if the form included a `next` target (for returning to calendar), redirect there
     next_target = request.form.get('next') or request.args.get('next')
@@ -196,25 +128,15 @@ def toggle_task():
     tid = data.get('id')
     if tid is None:
         return jsonify({'error': 'missing id'}), 400
-    conn = get_db_connection()
-    cur = conn.cursor()
     user = session.get('user')
     # ensure the task belongs to the current user (allow legacy NULL owner tasks)
-    cur.execute('SELECT status FROM tasks WHERE id = ? AND (user = ? OR user IS NULL)', (int(tid), user))
-    row = cur.fetchone()
-    if not row:
-        conn.close()
+    current = repo.get_task_status(int(tid), user)
+    if current is None:
         return jsonify({'error': 'not found or unauthorized'}), 404
-    current = row['status']
     new_status = 'todo' if current == 'done' else 'done'
     # set or clear completed_at when status changes
-    if new_status == 'done':
-        completed_at = datetime.utcnow().date().isoformat()
-        cur.execute('UPDATE tasks SET status = ?, completed_at = ? WHERE id = ? AND (user = ? OR user IS NULL)', (new_status, completed_at, int(tid), user))
-    else:
-        cur.execute('UPDATE tasks SET status = ?, completed_at = NULL WHERE id = ? AND (user = ? OR user IS NULL)', (new_status, int(tid), user))
-    conn.commit()
-    conn.close()
+    completed_at = datetime.utcnow().date().isoformat() if new_status == 'done' else None
+    repo.set_task_status(int(tid), user, new_status, completed_at)
     return jsonify({'id': int(tid), 'status': new_status})
 
 
@@ -227,9 +149,11 @@ def projects():
     if not user:
         return redirect(url_for('login'))
 
+    # read the cursor first: anything written after it shows up in the next sync
+    sync_cursor = repo.current_change_seq(user)
     # Filter tasks by current user
-    all_tasks = load_all_tasks()
-    tasks = [t for t in all_tasks if t.get('user') == user or not t.get('user')]  # include tasks without user for backwards compat
+    # include tasks without user for backwards compat
+    tasks = repo.list_tasks(user=user, include_unowned=True)
     
     proj_map = defaultdict(lambda: {'task_count': 0, 'completed': 0})
     for t in tasks:
@@ -239,11 +163,15 @@ def projects():
             proj_map[name]['completed'] += 1
 
     # load stored projects for current user (so projects with zero tasks are included)
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('SELECT id, name, description FROM projects WHERE user = ? ORDER BY name COLLATE NOCASE', (user,))
-    stored = cur.fetchall()
-    conn.close()
+    stored = repo.list_projects(user)
+
+    # what /api/sync deltas apply to: the user's own tasks and stored projects
+    # (ownerless tasks are counted above but never synced, so they stay fixed)
+    sync_state = {
+        'cursor': sync_cursor,
+        'tasks': [[t['id'], t['project'], t['status']] for t in tasks if t.get('user') == user],
+        'projects': [[r['id'], r['name']] for r in stored],
+    }
 
     projects_list = []
     seen = set()
@@ -277,7 +205,7 @@ def projects():
         })
 
     projects_list = sorted(projects_list, key=lambda p: p['name'].lower())
-    return render_template('projects.html', user_name=session.get('user', 'Arnis'), projects=projects_list)
+    return render_template('projects.html', user_name=session.get('user', 'Arnis'), projects=projects_list, sync_state=sync_state)
 
 
 # Simple health check endpoint for uptime checks
@@ -286,6 +214,12 @@ def health():
     return jsonify({'status': 'ok'}), 200
 
 
+# Last run of each background maintenance job (backup, optimize, checkpoint, vacuum, tombstone pruning)
+@app.route('/health/maintenance')
+def maintenance_status():
+    return jsonify(maintenance.get_status()), 200
+
+
 @app.route('/add_project', methods=['POST'])
 def add_project():
     # Persist project in SQLite for current user
@@ -296,13 +230,7 @@ def add_project():
     name = request.form.get('name')
     description = request.form.get('description') or ''
     if name:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        try:
-            cur.execute('INSERT OR IGNORE INTO projects (user, name, description) VALUES (?, ?, ?)', (user, name, description))
-            conn.commit()
-        finally:
-            conn.close()
+        repo.add_project(user, name, description)
     return redirect(url_for('projects'))
 
 
@@ -316,11 +244,7 @@ def delete_task():
         tid = int(tid)
     except Exception:
         return jsonify({'error': 'invalid id'}), 400
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('DELETE FROM tasks WHERE id = ?', (tid,))
-    conn.commit()
-    conn.close()
+    repo.delete_task(tid, user=session.get('user'))
     return jsonify({'ok': True, 'id': tid})
 
 
@@ -333,35 +257,22 @@ def delete_project():
     data = request.get_json() or {}
     pid = data.get('id')
     name = data.get('name') or request.form.get('name')
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
-        if pid:
-            try:
-                pid = int(pid)
-            except Exception:
-                return jsonify({'error': 'invalid id'}), 400
-            # get name for cascade deletion of tasks, verify ownership
-            cur.execute('SELECT name FROM projects WHERE id = ? AND user = ?', (pid, user))
-            row = cur.fetchone()
-            if row:
-                pname = row['name']
-                cur.execute('DELETE FROM projects WHERE id = ? AND user = ?', (pid, user))
-                cur.execute('DELETE FROM tasks WHERE project = ? AND (user = ? OR user IS NULL)', (pname, user))
-                conn.commit()
-                return jsonify({'ok': True, 'id': pid, 'name': pname})
-            else:
-                return jsonify({'error': 'not found or unauthorized'}), 404
-        elif name:
-            # delete tasks with this project name and any project record for current user
-            cur.execute('DELETE FROM projects WHERE name = ? AND user = ?', (name, user))
-            cur.execute('DELETE FROM tasks WHERE project = ? AND (user = ? OR user IS NULL)', (name, user))
-            conn.commit()
-            return jsonify({'ok': True, 'name': name})
-        else:
-            return jsonify({'error': 'missing id or name'}), 400
-    finally:
-        conn.close()
+    if pid:
+        try:
+            pid = int(pid)
+        except Exception:
+            return jsonify({'error': 'invalid id'}), 400
+        # cascades to the project's tasks, verifying ownership
+        pname = repo.delete_project(user, project_id=pid)
+        if pname is None:
+            return jsonify({'error': 'not found or unauthorized'}), 404
+        return jsonify({'ok': True, 'id': pid, 'name': pname})
+    elif name:
+        # delete tasks with this project name and any project record for current user
+        repo.delete_project(user, name=name)
+        return jsonify({'ok': True, 'name': name})
+    else:
+        return jsonify({'error': 'missing id or name'}), 400
 
 
 @app.route('/reports')
@@ -511,6 +422,21 @@ def calendar():
     return render_template('calendar.html', user_name=session.get('user', 'Arnis'), calendar_weeks=calendar_weeks, events=events, month_title=month_title, prev_year=prev_year, prev_month=prev_month, next_year=next_year, next_month=next_month)
 
 
+@app.route('/api/sync')
+def api_sync():
+    """Return tasks/projects changed since the client's `since` cursor, plus deletions."""
+    user = session.get('user')
+    if not user:
+        return jsonify({'error': 'unauthorized'}), 401
+    try:
+        since = int(request.args.get('since', '0') or 0)
+    except Exception:
+        return jsonify({'error': 'invalid since'}), 400
+    if since < 0:
+        return jsonify({'error': 'invalid since'}), 400
+    return jsonify(repo.load_changes(user, since))
+
+
 @app.route('/api/upcoming')
 def api_upcoming():
     """Return JSON list of tasks due tomorrow (1 day left) and not completed (user-specific)."""
@@ -518,30 +444,33 @@ def api_upcoming():
     if not user:
         return jsonify({'error': 'unauthorized'}), 401
     
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
-        # Select tasks with due_sort equal to tomorrow's date, not done, and belonging to current user
-        cur.execute("SELECT * FROM tasks WHERE due_sort IS NOT NULL AND due_sort <> '' AND DATE(due_sort) = DATE('now','+1 day') AND status != 'done' AND (user = ? OR user IS NULL)", (user,))
-        rows = cur.fetchall()
-        tasks = []
-        for r in rows:
-            tasks.append({
-                'id': r['id'],
-                'project': r['project'],
-                'title': r['title'],
-                'due_sort': r['due_sort'],
-                'status': r['status']
-            })
-        return jsonify({'count': len(tasks), 'tasks': tasks})
-    finally:
-        conn.close()
+    from datetime import timedelta
+    # Tasks due tomorrow (UTC), not done, and belonging to current user
+    tomorrow = (datetime.utcnow().date() + timedelta(days=1)).isoformat()
+    tasks = []
+    for t in repo.upcoming_tasks(user, tomorrow):
+        tasks.append({
+            'id': t['id'],
+            'project': t['project'],
+            'title': t['title'],
+            'due_sort': t['due_sort'],
+            'status': t['status']
+        })
+    return jsonify({'count': len(tasks), 'tasks': tasks})
+
+
+@app.before_request
+def track_activity():
+    # maintenance jobs wait for a quiet period; real requests reset the clock
+    if MAINTENANCE_ENABLED:
+        busy = request.endpoint not in MAINTENANCE_IGNORED_ENDPOINTS
+        maintenance.note_activity(BACKUP_DIR, repo, busy=busy)
 
 
 @app.before_request
 def require_login():
     # Allow unauthenticated access to login, register and static assets
-    allowed_endpoints = ('login', 'register', 'static', 'health')
+    allowed_endpoints = ('login', 'register', 'static', 'health', 'maintenance_status')
     endpoint = request.endpoint
     if endpoint is None or endpoint in allowed_endpoints:
         return
@@ -562,11 +491,7 @@ def login():
         if not email or not password:
             error = 'E-posta ve şifre girin.'
         else:
-            conn = get_db_connection()
-            cur = conn.cursor()
-            cur.execute('SELECT id, password_hash, first_name FROM users WHERE email = ?', (email,))
-            row = cur.fetchone()
-            conn.close()
+            row = repo.get_user(email)
             if not row:
                 error = 'Kayıt bulunamadı. Lütfen önce kayıt olun.'
             else:
@@ -610,17 +535,11 @@ def register():
         elif password != password_confirm:
             error = 'Şifreler eşleşmiyor.'
         else:
-            conn = get_db_connection()
-            cur = conn.cursor()
-            cur.execute('SELECT id FROM users WHERE email = ?', (email,))
-            if cur.fetchone():
+            if repo.get_user(email):
                 # already registered
-                conn.close()
                 return redirect(url_for('login'))
             pw_hash = generate_password_hash(password)
-            cur.execute('INSERT INTO users (email, password_hash, first_name, last_name) VALUES (?, ?, ?, ?)', (email, pw_hash, first_name, last_name))
-            conn.commit()
-            conn.close()
+            repo.create_user(email, pw_hash, first_name, last_name)
             session['user'] = email
             session['display_name'] = first_name or email
             return redirect(url_for('index'))
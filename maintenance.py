@@ -0,0 +1,387 @@
+"""Online database maintenance: incremental backups, optimize, checkpoints.
+
+Every job works against the live SQLite files without blocking writers for
+long. The files come from the repository: data.db, or users.db plus every
+shard with the sharded backend (each backed up on its own). Backups use the sqlite3 backup API in small page steps with a sleep
+between them so requests keep flowing while a copy is taken. The remaining
+jobs are cheap PRAGMAs that the scheduler only runs once the app has been
+idle for a while. Pruning old sync tombstones goes through the repository,
+so it also runs for the sharded and PostgreSQL backends.
+"""
+from datetime import datetime
+import os
+import sqlite3
+import threading
+import time
+
+# Tunables (override through the environment, like SECRET_KEY in app.py)
+BACKUP_PAGES_PER_STEP = int(os.environ.get('BACKUP_PAGES_PER_STEP', '64'))
+BACKUP_STEP_SLEEP = float(os.environ.get('BACKUP_STEP_SLEEP', '0.05'))
+BACKUP_KEEP = int(os.environ.get('BACKUP_KEEP', '7'))
+# SQLite restarts a backup whenever another connection writes to the source;
+# give up after this many restarts and try again after RETRY_SECONDS
+BACKUP_MAX_RESTARTS = int(os.environ.get('BACKUP_MAX_RESTARTS', '3'))
+RETRY_SECONDS = float(os.environ.get('MAINTENANCE_RETRY_SECONDS', '900'))
+QUIET_SECONDS = float(os.environ.get('MAINTENANCE_QUIET_SECONDS', '30'))
+POLL_SECONDS = float(os.environ.get('MAINTENANCE_POLL_SECONDS', '10'))
+VACUUM_PAGES = int(os.environ.get('MAINTENANCE_VACUUM_PAGES', '256'))
+# deletions are kept this long for /api/sync; older cursors get a reset
+TOMBSTONE_TTL_DAYS = int(os.environ.get('TOMBSTONE_TTL_DAYS', '30'))
+
+# How often each job may run (seconds) once the app is quiet
+JOB_INTERVALS = {
+    'backup': float(os.environ.get('MAINTENANCE_BACKUP_INTERVAL', str(6 * 3600))),
+    'optimize': float(os.environ.get('MAINTENANCE_OPTIMIZE_INTERVAL', str(3600))),
+    'checkpoint': float(os.environ.get('MAINTENANCE_CHECKPOINT_INTERVAL', '300')),
+    'incremental_vacuum': float(os.environ.get('MAINTENANCE_VACUUM_INTERVAL', str(3600))),
+    'prune_tombstones': float(os.environ.get('MAINTENANCE_PRUNE_INTERVAL', str(24 * 3600))),
+}
+
+_SQLITE_BUSY = 5
+_SQLITE_LOCKED = 6
+
+# left out of the unauthenticated status endpoint
+_PRIVATE_FIELDS = ('path', 'error')
+
+_lock = threading.Lock()
+_status = {}
+_last_activity = time.monotonic()
+_scheduler = None
+_scheduler_pid = None
+
+
+class _BackupRestarted(Exception):
+    pass
+
+
+def _connect(db_path):
+    # short busy timeout: maintenance should yield to traffic, not queue behind it
+    conn = sqlite3.connect(db_path, timeout=1.0)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _record(job, started, result):
+    result.update({
+        'job': job,
+        'started_at': datetime.utcfromtimestamp(started).isoformat() + 'Z',
+        'duration_seconds': round(time.time() - started, 4),
+    })
+    with _lock:
+        _status[job] = result
+    return result
+
+
+def _run(job, fn, *args):
+    """Run a job, recording its result (or error) in the shared status table."""
+    started = time.time()
+    try:
+        result = fn(*args)
+        result.setdefault('ok', True)
+    except Exception as exc:
+        result = {'ok': False, 'error': str(exc), 'pages_copied': 0, 'lock_wait_seconds': 0.0}
+    return _record(job, started, result)
+
+
+def _backup(db_path, dest_dir):
+    os.makedirs(dest_dir, exist_ok=True)
+    stamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+    # data.db -> data-<stamp>.db, a shard user-<hash>.db -> user-<hash>-<stamp>.db
+    name = os.path.splitext(os.path.basename(db_path))[0]
+    dest_path = os.path.join(dest_dir, f'{name}-{stamp}.db')
+    tmp_path = dest_path + '.part'
+    stats = {'pages_copied': 0, 'pages_total': 0, 'steps': 0, 'restarts': 0, 'lock_wait_seconds': 0.0}
+    last_remaining = [None]
+
+    def progress(status, remaining, total):
+        stats['steps'] += 1
+        if last_remaining[0] is not None and remaining > last_remaining[0]:
+            # a write to the source made SQLite start the copy over
+            stats['restarts'] += 1
+            if stats['restarts'] > BACKUP_MAX_RESTARTS:
+                raise _BackupRestarted()
+        last_remaining[0] = remaining
+        stats['pages_total'] = total
+        stats['pages_copied'] = total - remaining
+        if status in (_SQLITE_BUSY, _SQLITE_LOCKED):
+            # sqlite3 sleeps `sleep` seconds itself before retrying a busy step
+            stats['lock_wait_seconds'] += BACKUP_STEP_SLEEP
+        elif remaining:
+            # give writers room between successful steps
+            time.sleep(BACKUP_STEP_SLEEP)
+
+    src = _connect(db_path)
+    dst = sqlite3.connect(tmp_path)
+    restarted = False
+    try:
+        src.backup(dst, pages=BACKUP_PAGES_PER_STEP, progress=progress, sleep=BACKUP_STEP_SLEEP)
+    except _BackupRestarted:
+        restarted = True
+    finally:
+        dst.close()
+        src.close()
+    stats['lock_wait_seconds'] = round(stats['lock_wait_seconds'], 4)
+    if restarted:
+        # the scheduler retries after RETRY_SECONDS, hopefully in a calmer moment
+        os.remove(tmp_path)
+        stats.update({'ok': False, 'aborted': 'source kept changing', 'pages_copied': 0})
+        return stats
+    os.replace(tmp_path, dest_path)
+    _prune_backups(dest_dir, name)
+    stats['path'] = dest_path
+    return stats
+
+
+def _prune_backups(dest_dir, name):
+    # <name>-YYYYmmdd-HHMMSS.db, so 'user-1' never matches 'user-12-...'
+    prefix = f'{name}-'
+    names = sorted(n for n in os.listdir(dest_dir)
+                   if n.startswith(prefix) and n.endswith('.db') and len(n) == len(prefix) + 18)
+    for name in names[:-BACKUP_KEEP] if BACKUP_KEEP > 0 else []:
+        try:
+            os.remove(os.path.join(dest_dir, name))
+        except OSError:
+            pass
+
+
+def _timed_execute(conn, sql):
+    """Execute `sql`, returning (rows, seconds spent waiting on the write lock)."""
+    waited = 0.0
+    while True:
+        t0 = time.monotonic()
+        try:
+            return conn.execute(sql).fetchall(), waited
+        except sqlite3.OperationalError as exc:
+            if 'locked' not in str(exc) or waited > 30:
+                raise
+            waited += time.monotonic() - t0
+
+
+def _optimize(db_path):
+    conn = _connect(db_path)
+    try:
+        _, waited = _timed_execute(conn, 'PRAGMA optimize')
+        conn.commit()
+    finally:
+        conn.close()
+    return {'pages_copied': 0, 'lock_wait_seconds': round(waited, 4)}
+
+
+def _checkpoint(db_path):
+    conn = _connect(db_path)
+    try:
+        mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+        if mode != 'wal':
+            return {'skipped': f'journal_mode={mode}', 'pages_copied': 0, 'lock_wait_seconds': 0.0}
+        # PASSIVE never waits on readers or writers; it copies what it can
+        rows, waited = _timed_execute(conn, 'PRAGMA wal_checkpoint(PASSIVE)')
+    finally:
+        conn.close()
+    busy, log_frames, checkpointed = rows[0]
+    return {
+        'busy': bool(busy),
+        'wal_frames': log_frames,
+        'pages_copied': checkpointed,
+        'lock_wait_seconds': round(waited, 4),
+    }
+
+
+def _incremental_vacuum(db_path):
+    conn = _connect(db_path)
+    try:
+        auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+        free_before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if auto_vacuum != 2:
+            # incremental_vacuum is a no-op unless auto_vacuum=INCREMENTAL
+            return {'skipped': 'auto_vacuum is not INCREMENTAL (run enable_auto_vacuum)', 'freelist_pages': free_before,
+                    'pages_copied': 0, 'lock_wait_seconds': 0.0}
+        _, waited = _timed_execute(conn, f'PRAGMA incremental_vacuum({VACUUM_PAGES})')
+        conn.commit()
+        free_after = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    finally:
+        conn.close()
+    return {'pages_freed': free_before - free_after, 'freelist_pages': free_after,
+            'pages_copied': 0, 'lock_wait_seconds': round(waited, 4)}
+
+
+def _enable_auto_vacuum(db_path):
+    # a full VACUUM holds the write lock for the whole rebuild, so this is
+    # only ever run by hand, never by the scheduler
+    conn = _connect(db_path)
+    try:
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+            return {'skipped': 'auto_vacuum is already INCREMENTAL', 'pages_copied': 0, 'lock_wait_seconds': 0.0}
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        _, waited = _timed_execute(conn, 'VACUUM')
+        pages = conn.execute('PRAGMA page_count').fetchone()[0]
+    finally:
+        conn.close()
+    return {'pages_copied': pages, 'lock_wait_seconds': round(waited, 4)}
+
+
+def _prune_tombstones(repo):
+    return {'tombstones_pruned': repo.prune_tombstones(TOMBSTONE_TTL_DAYS),
+            'older_than_days': TOMBSTONE_TTL_DAYS, 'pages_copied': 0, 'lock_wait_seconds': 0.0}
+
+
+def _each_file(fn, db_paths, *args):
+    """Run a file job on every database in `db_paths` and add up the results.
+
+    A single file reports exactly what the job returned. For several
+    (the sharded backend) numbers are summed, skip/abort reasons counted,
+    and `failed` says how many files didn't make it.
+    """
+    results = []
+    for db_path in db_paths:
+        try:
+            result = fn(db_path, *args)
+        except Exception as exc:
+            result = {'ok': False, 'error': str(exc)}
+        results.append(result)
+    if len(results) == 1:
+        return dict(results[0], databases=1)
+    total = {'databases': len(results), 'failed': 0, 'pages_copied': 0, 'lock_wait_seconds': 0.0}
+    for result in results:
+        if result.get('ok') is False:
+            total['failed'] += 1
+            total.setdefault('error', result.get('error') or result.get('aborted'))
+        for key, value in result.items():
+            if key in ('ok', 'error', 'path'):
+                continue
+            if isinstance(value, bool):
+                total[key] = total.get(key, False) or value
+            elif isinstance(value, (int, float)):
+                total[key] = total.get(key, 0) + value
+            elif isinstance(value, str):
+                reasons = total.setdefault(key, {})
+                reasons[value] = reasons.get(value, 0) + 1
+    total['lock_wait_seconds'] = round(total['lock_wait_seconds'], 4)
+    total['ok'] = not total['failed']
+    return total
+
+
+def run_backup(db_paths, dest_dir):
+    return _run('backup', _each_file, _backup, db_paths, dest_dir)
+
+
+def run_optimize(db_paths):
+    return _run('optimize', _each_file, _optimize, db_paths)
+
+
+def run_checkpoint(db_paths):
+    return _run('checkpoint', _each_file, _checkpoint, db_paths)
+
+
+def run_incremental_vacuum(db_paths):
+    return _run('incremental_vacuum', _each_file, _incremental_vacuum, db_paths)
+
+
+def run_enable_auto_vacuum(db_paths):
+    return _run('enable_auto_vacuum', _each_file, _enable_auto_vacuum, db_paths)
+
+
+def run_prune_tombstones(repo):
+    return _run('prune_tombstones', _prune_tombstones, repo)
+
+
+def get_status():
+    """Return a snapshot of the last result of every job plus scheduler state.
+
+    Served without login, so file paths and error text are left out.
+    """
+    with _lock:
+        jobs = {name: {k: v for k, v in result.items() if k not in _PRIVATE_FIELDS}
+                for name, result in _status.items()}
+    return {
+        'scheduler_running': bool(_scheduler and _scheduler.is_alive() and _scheduler_pid == os.getpid()),
+        'idle_seconds': round(time.monotonic() - _last_activity, 1),
+        'quiet_after_seconds': QUIET_SECONDS,
+        'jobs': jobs,
+    }
+
+
+def _scheduler_loop(dest_dir, repo):
+    jobs = {}
+    if repo.database_files():
+        # listed again on every run: the sharded backend adds shards as users arrive
+        jobs.update({
+            'checkpoint': lambda: run_checkpoint(repo.database_files()),
+            'optimize': lambda: run_optimize(repo.database_files()),
+            'incremental_vacuum': lambda: run_incremental_vacuum(repo.database_files()),
+            'backup': lambda: run_backup(repo.database_files(), dest_dir),
+        })
+    jobs['prune_tombstones'] = lambda: run_prune_tombstones(repo)
+    # monotonic() counts from boot, so 0.0 would hold jobs back on a fresh host
+    last_run = {name: float('-inf') for name in jobs}
+    while True:
+        time.sleep(POLL_SECONDS)
+        for name, job in jobs.items():
+            # re-check before every job so a burst of traffic interrupts the batch
+            if time.monotonic() - _last_activity < QUIET_SECONDS:
+                break
+            if time.monotonic() - last_run[name] < JOB_INTERVALS[name]:
+                continue
+            result = job()
+            last_run[name] = time.monotonic()
+            if not result.get('ok'):
+                # failed or aborted: try again sooner than the full interval
+                last_run[name] -= max(0.0, JOB_INTERVALS[name] - RETRY_SECONDS)
+
+
+def note_activity(dest_dir, repo, busy=True):
+    """Mark the app as busy and make sure the scheduler runs in this process.
+
+    The file jobs run over repo.database_files() (none for PostgreSQL),
+    backing up into `dest_dir`; tombstone pruning goes through `repo`.
+    Pass busy=False for requests that shouldn't hold the jobs back (health
+    probes, static files).
+
+    Called from a before_request hook. The thread is started lazily (and
+    restarted after a fork) because gunicorn --preload imports the app in
+    the master process, whose threads don't survive into the workers.
+    """
+    global _last_activity, _scheduler, _scheduler_pid
+    if busy:
+        _last_activity = time.monotonic()
+    if _scheduler_pid == os.getpid():
+        return
+    with _lock:
+        if _scheduler_pid == os.getpid():
+            return
+        _scheduler = threading.Thread(target=_scheduler_loop, args=(dest_dir, repo),
+                                      name='db-maintenance', daemon=True)
+        _scheduler.start()
+        _scheduler_pid = os.getpid()
+
+
+if __name__ == '__main__':
+    # one-off runs from the shell:
+    # python maintenance.py backup|optimize|checkpoint|vacuum|prune|enable_auto_vacuum
+    # same environment as the app (STORAGE_BACKEND, DB_PATH, SHARD_DIR ...)
+    import json
+    import sys
+    import storage
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    backups = os.environ.get('BACKUP_DIR', os.path.join(base_dir, 'backups'))
+    repo = storage.create_repository({
+        'STORAGE_BACKEND': os.environ.get('STORAGE_BACKEND', 'sqlite'),
+        'DB_PATH': os.environ.get('DB_PATH', os.path.join(base_dir, 'data.db')),
+        'DATABASE_URL': os.environ.get('DATABASE_URL'),
+        'SHARD_DIR': os.environ.get('SHARD_DIR', os.path.join(base_dir, 'shards')),
+        'CENTRAL_DB_PATH': os.environ.get('CENTRAL_DB_PATH'),
+        'SHARD_BUCKETS': os.environ.get('SHARD_BUCKETS', '0'),
+    })
+    files = repo.database_files()
+    commands = {
+        'backup': lambda: run_backup(files, backups),
+        'optimize': lambda: run_optimize(files),
+        'checkpoint': lambda: run_checkpoint(files),
+        'vacuum': lambda: run_incremental_vacuum(files),
+        'prune': lambda: run_prune_tombstones(repo),
+        'enable_auto_vacuum': lambda: run_enable_auto_vacuum(files),
+    }
+    for cmd in sys.argv[1:] or ['backup']:
+        if cmd not in commands:
+            sys.exit(f'unknown job: {cmd} (choose from {", ".join(commands)})')
+        print(json.dumps(commands[cmd](), indent=2))
+    repo.close()
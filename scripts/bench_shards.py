@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Write throughput of the single data.db store vs per-user shards.
+
+Usage: python scripts/bench_shards.py [writes_per_user] [processes ...]
+Each process plays a different user and adds tasks as fast as it can, the
+way separate gunicorn workers would. Processes (not threads), so the GIL
+and the router's locks don't hide the database lock. Three layouts:
+
+    single    the default backend, SQLiteRepository on one file
+              (a new connection per call)
+    one-file  the sharded router with SHARD_BUCKETS=1: kept-open
+              connections, but every user still in one file
+    sharded   the sharded router with one file per user
+
+single -> one-file is what reusing connections buys; one-file -> sharded
+is what splitting the write lock buys, and that part depends on the host
+(CPU count, fsync cost). On a 1-CPU VM, connection reuse was worth 3-6x
+at every level, while separate files ranged from no gain with one writer
+to 1.3-1.9x at 4-8 processes, varying a lot between runs. Run it on the
+target machine before switching backends. Runs in a throwaway
+directory; data.db is never touched.
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import ShardedSQLiteRepository, SQLiteRepository  # noqa: E402
+
+
+def make_repo(kind, path):
+    if kind == 'single':
+        return SQLiteRepository(os.path.join(path, 'single.db'))
+    if kind == 'one-file':
+        # the router with one bucket: kept-open connections, one file
+        return ShardedSQLiteRepository(os.path.join(path, 'one-file'), buckets=1)
+    return ShardedSQLiteRepository(os.path.join(path, 'shards'))
+
+
+def worker(kind, path, user, writes, barrier, results):
+    repo = make_repo(kind, path)
+    errors = 0
+    barrier.wait()
+    t0 = time.perf_counter()
+    for i in range(writes):
+        try:
+            repo.add_task(user, 'Bench', f'Görev {i}', '', 'medium', '', '')
+        except Exception:
+            # "database is locked" once the busy timeout runs out
+            errors += 1
+    results.put((t0, time.perf_counter(), errors))
+    repo.close()
+
+
+def run(kind, path, processes, writes):
+    repo = make_repo(kind, path)
+    repo.init_schema()
+    # create (and migrate) every shard up front so only writes are timed
+    for n in range(processes):
+        repo.current_change_seq(f'bench-{n}@example.com')
+    repo.close()
+    barrier = multiprocessing.Barrier(processes)
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=worker, args=(kind, path, f'bench-{n}@example.com', writes, barrier, results))
+             for n in range(processes)]
+    for p in procs:
+        p.start()
+    timings = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    elapsed = max(t[1] for t in timings) - min(t[0] for t in timings)
+    errors = sum(t[2] for t in timings)
+    return (processes * writes - errors) / elapsed, errors
+
+
+def main():
+    writes = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    levels = [int(a) for a in sys.argv[2:]] or [1, 2, 4, 8]
+    print(f'{writes} writes per user, {os.cpu_count()} CPUs (writes/s, errors in brackets)')
+    print(f'{"procs":>6} {"single":>12} {"one-file":>12} {"sharded":>12} {"shards vs one-file":>19}')
+    for processes in levels:
+        tmp_dir = tempfile.mkdtemp(prefix='bench_shards_')
+        rates = {kind: run(kind, tmp_dir, processes, writes) for kind in ('single', 'one-file', 'sharded')}
+        cells = ' '.join(f'{f"{rate:.0f} [{errors}]":>12}' for rate, errors in rates.values())
+        print(f'{processes:>6} {cells} {rates["sharded"][0] / rates["one-file"][0]:>18.2f}x')
+
+if __name__ == '__main__':
+    main()
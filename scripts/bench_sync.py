@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Compare a full /tasks reload with /api/sync after a single change.
+
+Usage: python scripts/bench_sync.py [task_count ...]
+With the default SQLite backend it runs against a throwaway database and
+data.db is never touched. With STORAGE_BACKEND=postgres it uses
+DATABASE_URL and writes tasks for fresh bench-<n>@example.com users only.
+"""
+import os
+import sys
+import tempfile
+import time
+
+tmp_dir = tempfile.mkdtemp(prefix='bench_sync_')
+os.environ.setdefault('DB_PATH', os.path.join(tmp_dir, 'bench.db'))
+os.environ['MAINTENANCE_ENABLED'] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+ROUNDS = 20
+
+
+def seed(user, count):
+    """Create `count` tasks for `user` and return the id of the first one."""
+    priorities = ('high', 'medium', 'low')
+    first = None
+    for i in range(count):
+        due = f'2026-{(i % 12) + 1:02d}-{(i % 28) + 1:02d}'
+        tid = app.repo.add_task(user, f'Proje {i % 10}', f'Görev {i}', 'Açıklama ' * 5, priorities[i % 3], due, due)
+        first = first or tid
+    return first
+
+
+def measure(client, url):
+    best = None
+    size = 0
+    for _ in range(ROUNDS):
+        t0 = time.perf_counter()
+        res = client.get(url)
+        elapsed = time.perf_counter() - t0
+        size = len(res.data)
+        best = elapsed if best is None else min(best, elapsed)
+    return size, best
+
+
+def main():
+    counts = [int(a) for a in sys.argv[1:]] or [100, 1000, 5000]
+    print(f'backend: {app.repo.name}')
+    print(f'{"tasks":>7} {"reload bytes":>13} {"reload ms":>10} {"sync bytes":>11} {"sync ms":>8}')
+    for count in counts:
+        user = f'bench-{count}-{os.getpid()}@example.com'
+        client = app.app.test_client()
+        with client.session_transaction() as sess:
+            sess['user'] = user
+        tid = seed(user, count)
+        cursor = app.repo.current_change_seq(user)
+        client.post('/toggle_task', json={'id': tid})
+        full_size, full_time = measure(client, '/tasks')
+        sync_size, sync_time = measure(client, f'/api/sync?since={cursor}')
+        print(f'{count:>7} {full_size:>13} {full_time * 1000:>10.2f} {sync_size:>11} {sync_time * 1000:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Assert that the task list/calendar/upcoming queries sort from the index.
+
+Usage: python scripts/check_query_plans.py
+Same environment as the app. For SQLite (the default, and what every
+shard of the sharded backend runs) it builds a throwaway database with the
+app's schema, runs EXPLAIN QUERY PLAN on the repository's queries and
+exits non-zero if any of them scans the table or needs a temp B-tree to
+sort.
+
+With STORAGE_BACKEND=postgres it checks the PostgreSQL queries against
+DATABASE_URL instead. Rows are seeded and ANALYZEd in a transaction that
+is rolled back. A table that small is always cheapest to scan, so
+sequential scans, bitmap scans and sorts are priced out first. The check
+therefore asserts that one of the sort indexes can return the rows in
+order (no Sort node), not which plan the planner picks at production sizes.
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import SQLiteRepository  # noqa: E402
+from storage.sqlite import LIST_TASKS_SQL, LIST_TASKS_WITH_UNOWNED_SQL, UPCOMING_TASKS_SQL  # noqa: E402
+
+INDEX = 'idx_tasks_user_due_priority'
+# PostgreSQL reads legacy ownerless rows from a partial index
+PG_INDEXES = (INDEX, 'idx_tasks_unowned_due_priority')
+PRIORITIES = ('high', 'medium', 'low')
+
+QUERIES = {
+    # /tasks and /calendar
+    'list_tasks': (LIST_TASKS_SQL, ('a@example.com',)),
+    # /projects (includes legacy ownerless tasks)
+    'list_tasks_with_unowned': (LIST_TASKS_WITH_UNOWNED_SQL, ('a@example.com',)),
+    # /api/upcoming
+    'upcoming_tasks': (UPCOMING_TASKS_SQL, ('a@example.com', '2026-01-02', '2026-01-02')),
+}
+
+
+def postgres_queries():
+    from storage import postgres
+    # the ownerless halves are merged with the user's rows in Python
+    return {
+        'list_tasks': (postgres.LIST_TASKS_SQL, ('a@example.com',)),
+        'list_unowned_tasks': (postgres.LIST_UNOWNED_TASKS_SQL, ()),
+        'upcoming_tasks': (postgres.UPCOMING_TASKS_SQL, ('a@example.com', '2026-01-02')),
+        'upcoming_unowned_tasks': (postgres.UPCOMING_UNOWNED_TASKS_SQL, ('2026-01-02',)),
+    }
+
+
+def seed_rows():
+    for i in range(600):
+        user = None if i % 50 == 0 else f'user{i % 20}@example.com'
+        due = f'2026-01-{(i % 28) + 1:02d}' if i % 7 else ''
+        yield user, 'Genel', f'Görev {i}', '', PRIORITIES[i % 3], due, due
+
+
+def report(name, plan, problems):
+    print(f'{"FAIL" if problems else "ok  "} {name}')
+    for step in plan:
+        print(f'       {step}')
+    for problem in problems:
+        print(f'     ! {problem}')
+    return bool(problems)
+
+
+def check_sqlite():
+    repo = SQLiteRepository(os.path.join(tempfile.mkdtemp(prefix='query_plans_'), 'plans.db'))
+    repo.init_schema()
+    for row in seed_rows():
+        repo.add_task(*row)
+    conn = repo.connect()
+    conn.execute('ANALYZE')
+    conn.commit()
+    failed = False
+    for name, (sql, params) in QUERIES.items():
+        plan = [row['detail'] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+        problems = []
+        if any('TEMP B-TREE' in step for step in plan):
+            problems.append('sorts with a temp B-tree')
+        if any(step.startswith('SCAN') for step in plan):
+            problems.append('scans the table')
+        if not any(INDEX in step for step in plan):
+            problems.append(f'does not use {INDEX}')
+        failed = report(name, plan, problems) or failed
+    conn.close()
+    return failed
+
+
+def check_postgres():
+    from storage.postgres import PostgresRepository
+    repo = PostgresRepository(os.environ['DATABASE_URL'])
+    repo.init_schema()
+    failed = False
+    with repo.pool.connection() as conn:
+        try:
+            with conn.cursor() as cur:
+                cur.executemany('INSERT INTO tasks ("user", project, title, description, priority, due, due_sort) '
+                                'VALUES (%s, %s, %s, %s, %s, %s, %s)', list(seed_rows()))
+            conn.execute('ANALYZE tasks')
+            for setting in ('enable_seqscan', 'enable_bitmapscan', 'enable_sort'):
+                conn.execute(f'SET LOCAL {setting} = off')
+            for name, (sql, params) in postgres_queries().items():
+                plan = [row['QUERY PLAN'] for row in conn.execute('EXPLAIN ' + sql, params)]
+                problems = []
+                if any(step.lstrip(' ->').startswith(('Sort', 'Incremental Sort')) for step in plan):
+                    problems.append('needs a Sort node')
+                if any('Seq Scan' in step for step in plan):
+                    problems.append('scans the table')
+                if not any(index in step for step in plan for index in PG_INDEXES):
+                    problems.append(f'does not use {" or ".join(PG_INDEXES)}')
+                failed = report(name, plan, problems) or failed
+        finally:
+            # the seed rows never land
+            conn.rollback()
+    repo.close()
+    return failed
+
+
+def main():
+    print(f'backend: {os.environ.get("STORAGE_BACKEND", "sqlite")}')
+    if os.environ.get('STORAGE_BACKEND', 'sqlite').lower() in ('postgres', 'postgresql'):
+        failed = check_postgres()
+    else:
+        failed = check_sqlite()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
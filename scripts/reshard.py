@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""Split tasks/projects into per-user (or per-bucket) SQLite shards.
+
+Usage:
+    python scripts/reshard.py --source data.db --dest shards --unowned-owner admin@example.com
+    python scripts/reshard.py --source shards --dest shards-16 --buckets 16
+
+--source is either the single data.db file or an existing shard directory
+(for changing the bucket count). Users go to <dest>/users.db. Row ids are
+kept when the source is data.db. Each shard numbers its rows from 1, so
+when the source is a shard directory the ids would collide once shards
+are merged into buckets; there the destination assigns new ids.
+
+change_seq is restamped either way, so no sync cursor handed out before
+the move means anything afterwards. Every destination shard starts its
+counter above the highest source cursor and marks everything up to there
+as pruned: any old cursor then gets the app's reset signal, and the client
+replaces its cards (and their possibly renumbered ids) with a snapshot.
+
+Legacy tasks without an owner have no shard to live in, so they are
+assigned to the user given with --unowned-owner (required when there are
+any). Projects without an owner were never visible and are skipped.
+Duplicate projects (same user and name) are skipped and counted. The
+source is only read; run with the app stopped (or against a backup) so no
+writes are missed, then start it with STORAGE_BACKEND=sharded
+SHARD_DIR=<dest>.
+"""
+import argparse
+from collections import defaultdict
+import glob
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import SQLiteRepository, due_key, priority_rank, shard_file_name  # noqa: E402
+
+TASK_COLUMNS = ('id', 'project', 'title', 'description', 'priority', 'due', 'due_sort', 'status', 'completed_at', 'user')
+PROJECT_COLUMNS = ('id', 'user', 'name', 'description', 'created_at')
+USER_COLUMNS = ('id', 'email', 'password_hash', 'first_name', 'last_name', 'created_at')
+
+
+def connect(path):
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def columns(conn, table):
+    return {r['name'] for r in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def select(conn, table, wanted):
+    """Select `wanted` columns, filling NULL for ones an older schema lacks."""
+    have = columns(conn, table)
+    if not have:
+        return []
+    cols = ', '.join(c if c in have else f'NULL AS {c}' for c in wanted)
+    return [tuple(r) for r in conn.execute(f'SELECT {cols} FROM {table}')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--source', required=True, help='data.db file or existing shard directory')
+    parser.add_argument('--dest', required=True, help='new shard directory (must not contain shards yet)')
+    parser.add_argument('--buckets', type=int, default=0, help='hash buckets; 0 = one shard per user')
+    parser.add_argument('--users', help='users database (default: the source file, or <source>/users.db)')
+    parser.add_argument('--unowned-owner', help='email that legacy tasks without an owner are assigned to')
+    args = parser.parse_args()
+
+    # per-user shards all number from 1, so their ids can't be carried over
+    keep_ids = not os.path.isdir(args.source)
+    if keep_ids:
+        sources = [args.source]
+        users_path = args.users or args.source
+    else:
+        sources = sorted(glob.glob(os.path.join(args.source, 'user-*.db')) +
+                         glob.glob(os.path.join(args.source, 'bucket-*.db')))
+        users_path = args.users or os.path.join(args.source, 'users.db')
+    if os.path.isdir(args.dest) and glob.glob(os.path.join(args.dest, '*.db')):
+        sys.exit(f'{args.dest} already contains databases; pick an empty directory')
+
+    # read everything before writing anything, so a refusal leaves no files behind
+    conn = connect(users_path)
+    users = select(conn, 'users', USER_COLUMNS)
+    conn.close()
+    owners = {u[1] for u in users}
+    owned_tasks = defaultdict(list)
+    unowned_tasks = []
+    projects = defaultdict(list)
+    skipped_projects = 0
+    # highest sync cursor any client can hold (see the module docstring)
+    source_cursor = 0
+    for path in sources:
+        conn = connect(path)
+        if columns(conn, 'change_seq'):
+            source_cursor = max(source_cursor, conn.execute('SELECT seq FROM change_seq WHERE id = 1').fetchone()['seq'])
+        for row in select(conn, 'tasks', TASK_COLUMNS):
+            user = row[-1]
+            if user:
+                owners.add(user)
+                owned_tasks[user].append(row)
+            else:
+                unowned_tasks.append(row)
+        for row in select(conn, 'projects', PROJECT_COLUMNS):
+            if row[1]:
+                owners.add(row[1])
+                projects[row[1]].append(row)
+            else:
+                skipped_projects += 1
+        conn.close()
+
+    if unowned_tasks:
+        owner = (args.unowned_owner or '').strip().lower()
+        if not owner:
+            sys.exit(f'{len(unowned_tasks)} tasks have no owner and no shard to go to; '
+                     'pass --unowned-owner EMAIL to assign them to that user')
+        if owner not in owners:
+            print(f'note: --unowned-owner {owner} is not a registered user')
+        owners.add(owner)
+        owned_tasks[owner].extend(row[:-1] + (owner,) for row in unowned_tasks)
+
+    os.makedirs(args.dest, exist_ok=True)
+    central = SQLiteRepository(os.path.join(args.dest, 'users.db'))
+    central.init_schema(tasks=False)
+    conn = central.connect()
+    conn.executemany(f'INSERT INTO users ({", ".join(USER_COLUMNS)}) VALUES ({", ".join("?" * len(USER_COLUMNS))})', users)
+    conn.commit()
+    conn.close()
+
+    shard_rows = defaultdict(lambda: {'tasks': [], 'projects': []})
+    # sorted, so re-bucketing numbers rows the same way every time
+    for user in sorted(owners):
+        shard = shard_file_name(user, args.buckets)
+        shard_rows[shard]['tasks'].extend(owned_tasks[user])
+        shard_rows[shard]['projects'].extend(projects[user])
+
+    # sort keys are recomputed, since an old source may not have them
+    first = 0 if keep_ids else 1
+    task_columns = TASK_COLUMNS[first:] + ('priority_rank', 'due_key')
+    project_columns = PROJECT_COLUMNS[first:]
+    task_sql = f'INSERT INTO tasks ({", ".join(task_columns)}) VALUES ({", ".join("?" * len(task_columns))})'
+    # UNIQUE (user, name): a duplicate is skipped here and counted below
+    project_sql = f'INSERT OR IGNORE INTO projects ({", ".join(project_columns)}) VALUES ({", ".join("?" * len(project_columns))})'
+    # seq == pruned_seq: every old cursor (<= source_cursor) is below the
+    # floor and resets, every cursor handed out from here on is not
+    floor = source_cursor + 1
+    duplicate_projects = 0
+    for shard, rows in sorted(shard_rows.items()):
+        if not (rows['tasks'] or rows['projects']):
+            # created on first use instead; its cursor starts at 0, so an
+            # old cursor is "from the future" there and resets as well
+            continue
+        repo = SQLiteRepository(os.path.join(args.dest, shard))
+        repo.init_schema(users=False)
+        conn = repo.connect()
+        conn.execute('UPDATE change_seq SET seq = ?, pruned_seq = ? WHERE id = 1', (floor, floor))
+        # insert in id order so change_seq follows the original write order
+        task_rows = sorted(rows['tasks'], key=lambda r: r[0])
+        conn.executemany(task_sql, [r[first:] + (priority_rank(r[4]), due_key(r[6])) for r in task_rows])
+        project_rows = sorted(rows['projects'], key=lambda r: r[0])
+        inserted = conn.executemany(project_sql, [r[first:] for r in project_rows]).rowcount
+        conn.commit()
+        conn.close()
+        duplicates = len(project_rows) - inserted
+        duplicate_projects += duplicates
+        print(f'{shard}: {len(task_rows)} tasks, {inserted} projects' +
+              (f' ({duplicates} duplicate projects skipped)' if duplicates else ''))
+
+    print(f'{len(users)} users, {len(owners)} owners in {args.dest}' + ('' if keep_ids else ' (task/project ids renumbered)'))
+    print(f'sync cursors start above {source_cursor}; clients with an older one get a full reset')
+    if unowned_tasks:
+        print(f'assigned {len(unowned_tasks)} tasks without an owner to {owner}')
+    if skipped_projects:
+        print(f'skipped {skipped_projects} projects without an owner')
+    if duplicate_projects:
+        print(f'skipped {duplicate_projects} duplicate projects (same user and name)')
+    print(f'start the app with STORAGE_BACKEND=sharded SHARD_DIR={os.path.abspath(args.dest)}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""Storage backends for tasks, projects and users.
+
+`create_repository` picks the backend from config:
+
+    STORAGE_BACKEND=sqlite    (default) uses DB_PATH
+    STORAGE_BACKEND=postgres  uses DATABASE_URL, pooled (DB_POOL_MIN/DB_POOL_MAX)
+    STORAGE_BACKEND=sharded   one SQLite file per user under SHARD_DIR, or per
+                              hash bucket with SHARD_BUCKETS=N; at most
+                              SHARD_MAX_OPEN shard handles stay open
+"""
+from .base import Repository, due_key, priority_rank, project_row_to_dict, task_row_to_dict
+from .sharded import ShardedSQLiteRepository, shard_file_name
+from .sqlite import SQLiteRepository
+
+__all__ = ['Repository', 'SQLiteRepository', 'ShardedSQLiteRepository', 'create_repository', 'due_key',
+           'priority_rank', 'project_row_to_dict', 'shard_file_name', 'task_row_to_dict']
+
+
+def create_repository(config):
+    backend = (config.get('STORAGE_BACKEND') or 'sqlite').lower()
+    if backend == 'sqlite':
+        return SQLiteRepository(config['DB_PATH'])
+    if backend == 'sharded':
+        return ShardedSQLiteRepository(
+            config['SHARD_DIR'],
+            central_path=config.get('CENTRAL_DB_PATH'),
+            buckets=int(config.get('SHARD_BUCKETS', 0)),
+            max_open=int(config.get('SHARD_MAX_OPEN', 64)),
+        )
+    if backend in ('postgres', 'postgresql'):
+        # imported lazily so the optional driver is only needed when selected
+        from .postgres import PostgresRepository
+        dsn = config.get('DATABASE_URL')
+        if not dsn:
+            raise RuntimeError('STORAGE_BACKEND=postgres requires DATABASE_URL')
+        return PostgresRepository(dsn, min_size=int(config.get('DB_POOL_MIN', 1)), max_size=int(config.get('DB_POOL_MAX', 10)))
+    raise RuntimeError(f'unknown STORAGE_BACKEND: {backend}')
@@ -0,0 +1,170 @@
+"""Backend-neutral repository interface used by the Flask routes."""
+from datetime import datetime
+import re
+
+# Sort keys stored next to the text columns: lower rank = more urgent.
+# The SQL triggers in storage/sqlite.py and storage/postgres.py apply the
+# same rules, so keep them in step with these two functions.
+PRIORITY_RANKS = {'high': 0, 'medium': 1, 'low': 2}
+_ISO_DATE = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+
+def priority_rank(priority):
+    return PRIORITY_RANKS.get((priority or 'medium').strip().lower(), PRIORITY_RANKS['medium'])
+
+
+def due_key(due_sort):
+    """Return `due_sort` if it is a valid zero-padded YYYY-MM-DD date, else '' (sorts first)."""
+    value = (due_sort or '').strip()
+    # strptime alone would also take '2026-1-2', which the SQL triggers reject
+    if not _ISO_DATE.fullmatch(value):
+        return ''
+    try:
+        datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        return ''
+    return value
+
+
+def needs_reset(since, cursor, pruned_seq):
+    """True when a sync from `since` can't be answered as a delta.
+
+    Either the cursor is from the future (another database, or a restore
+    from backup) or tombstones it still needs have been pruned.
+    """
+    return since > cursor or 0 < since < pruned_seq
+
+
+def task_row_to_dict(r):
+    keys = r.keys()
+    return {
+        'id': r['id'],
+        'project': r['project'] or 'Genel',
+        'title': r['title'],
+        'description': r['description'] or '',
+        'priority': r['priority'] or 'medium',
+        'due': r['due'] or '',
+        'due_sort': r['due_sort'] or '',
+        'status': r['status'] or 'todo',
+        'completed_at': r['completed_at'] or '',
+        'user': r['user'] if 'user' in keys else None,
+        'change_seq': r['change_seq'] if 'change_seq' in keys else None
+    }
+
+
+def project_row_to_dict(r):
+    return {
+        'id': r['id'],
+        'name': r['name'],
+        'description': r['description'] or '',
+        'change_seq': r['change_seq'] if 'change_seq' in r.keys() else None
+    }
+
+
+class Repository:
+    """Task, project and user storage.
+
+    Every method opens (or borrows) its own connection and commits before
+    returning, so a repository instance is safe to share between threads.
+    Tasks whose `user` is NULL predate per-user ownership and stay visible
+    to every user, as they always have.
+    """
+
+    name = None
+
+    def init_schema(self, users=True, tasks=True):
+        """Create the user tables and/or the task/project tables."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def database_files(self):
+        """Return the SQLite files behind this store, for maintenance.py's file jobs.
+
+        Empty when a server looks after its own files (PostgreSQL).
+        """
+        return []
+
+    # tasks
+
+    def list_tasks(self, user=None, include_unowned=False):
+        """Return tasks (all, or only `user`'s) ordered by due_key, priority_rank, id.
+
+        With `include_unowned`, legacy tasks without an owner are included too.
+        """
+        raise NotImplementedError
+
+    def task_status_counts(self, user=None):
+        """Return {status: count} for all tasks, or only `user`'s."""
+        raise NotImplementedError
+
+    def add_task(self, user, project, title, description, priority, due, due_sort):
+        """Insert a todo task and return its id."""
+        raise NotImplementedError
+
+    def get_task_status(self, task_id, user):
+        """Return the task's status, or None if missing or owned by someone else."""
+        raise NotImplementedError
+
+    def set_task_status(self, task_id, user, status, completed_at=None):
+        raise NotImplementedError
+
+    def delete_task(self, task_id, user=None):
+        """Delete a task; when `user` is given it must own the task (or nobody may)."""
+        raise NotImplementedError
+
+    def upcoming_tasks(self, user, day):
+        """Return unfinished tasks due on `day` (an ISO date string)."""
+        raise NotImplementedError
+
+    # projects
+
+    def list_projects(self, user):
+        """Return the user's stored projects ordered by name, case-insensitively."""
+        raise NotImplementedError
+
+    def add_project(self, user, name, description):
+        """Store a project; an existing project with the same name is left alone."""
+        raise NotImplementedError
+
+    def delete_project(self, user, project_id=None, name=None):
+        """Delete a project and its tasks. Return the project name, or None if not found."""
+        raise NotImplementedError
+
+    # users
+
+    def get_user(self, email):
+        """Return {'id', 'email', 'password_hash', 'first_name'} or None."""
+        raise NotImplementedError
+
+    def create_user(self, email, password_hash, first_name, last_name):
+        raise NotImplementedError
+
+    # delta sync
+
+    def current_change_seq(self, user=None):
+        """Return the sync cursor for `user` (sharded stores need the user).
+
+        Passing it to load_changes as `since` returns every later change;
+        PostgreSQL derives it from the snapshot rather than from change_seq.
+        """
+        raise NotImplementedError
+
+    def load_changes(self, user, since=0):
+        """Return the user's tasks, projects and deletions with change_seq > `since`.
+
+        Everything is read from one snapshot so the returned cursor is exact:
+        a client that passes it back as `since` misses nothing. Tasks follow
+        the same visibility rule as list_tasks(user). When `since` can't be
+        served as a delta (see needs_reset) the result is a full snapshot
+        with `reset` set, and the client should drop its local state.
+        """
+        raise NotImplementedError
+
+    def prune_tombstones(self, older_than_days):
+        """Drop deletion records older than `older_than_days`; return how many went.
+
+        Clients whose cursor is older than the newest pruned record get a reset.
+        """
+        raise NotImplementedError
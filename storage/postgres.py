@@ -0,0 +1,352 @@
+"""PostgreSQL implementation of the repository.
+
+Requires the optional `psycopg` (3.x) and `psycopg_pool` packages:
+
+    pip install "psycopg[binary]" psycopg_pool
+
+Connections come from a thread-safe pool and every statement is sent with
+prepare=True, so each pooled connection parses and plans it only once.
+`user` is a reserved word in PostgreSQL, hence the quoted "user" column.
+
+Delta sync: every write stamps its row with `change_seq` from a SEQUENCE
+(no shared row lock, so writers don't queue) and with the id of the
+writing transaction in `change_xid`. Sequence values are handed out
+before commit, so they can't serve as a cursor: a transaction holding a
+low value may commit after a reader has moved past it. The cursor is
+instead one less than the xmin of the reader's snapshot; every transaction
+below xmin has finished, so anything it wrote is already visible, and
+anything still in flight has change_xid > cursor and turns up next time.
+A change can be sent twice, which the client's upsert handles.
+"""
+import heapq
+
+from .base import Repository, needs_reset, project_row_to_dict, task_row_to_dict
+
+try:
+    import psycopg
+    from psycopg.rows import dict_row
+    from psycopg_pool import ConnectionPool
+except ImportError:  # optional dependency
+    psycopg = None
+
+
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS tasks (
+        id BIGSERIAL PRIMARY KEY,
+        project TEXT,
+        title TEXT NOT NULL,
+        description TEXT,
+        priority TEXT,
+        due TEXT,
+        due_sort TEXT,
+        status TEXT DEFAULT 'todo',
+        completed_at TEXT,
+        "user" TEXT,
+        -- numeric priority / normalized due date so task lists sort from an index
+        priority_rank INTEGER NOT NULL DEFAULT 1,
+        due_key TEXT NOT NULL DEFAULT '',
+        change_seq BIGINT,
+        change_xid BIGINT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS projects (
+        id BIGSERIAL PRIMARY KEY,
+        "user" TEXT NOT NULL,
+        name TEXT NOT NULL,
+        description TEXT,
+        created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+        change_seq BIGINT,
+        change_xid BIGINT,
+        UNIQUE ("user", name)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS users (
+        id BIGSERIAL PRIMARY KEY,
+        email TEXT NOT NULL UNIQUE,
+        password_hash TEXT NOT NULL,
+        first_name TEXT,
+        last_name TEXT,
+        created_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    'CREATE SEQUENCE IF NOT EXISTS change_seq_seq',
+    # highest tombstone change_xid pruned so far; older cursors must start over
+    'CREATE TABLE IF NOT EXISTS sync_state (id INTEGER PRIMARY KEY CHECK (id = 1), pruned_xid BIGINT NOT NULL DEFAULT 0)',
+    'INSERT INTO sync_state (id) VALUES (1) ON CONFLICT (id) DO NOTHING',
+    '''
+    CREATE TABLE IF NOT EXISTS tombstones (
+        seq BIGINT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        row_id BIGINT NOT NULL,
+        "user" TEXT,
+        deleted_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
+        change_xid BIGINT
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_tasks_user_due_priority ON tasks ("user", due_key, priority_rank, id)',
+    # "user" IS NULL doesn't pin the leading column the way "user" = %s does,
+    # so legacy ownerless rows need their own index to come back in order
+    'CREATE INDEX IF NOT EXISTS idx_tasks_unowned_due_priority ON tasks (due_key, priority_rank, id) WHERE "user" IS NULL',
+    'CREATE INDEX IF NOT EXISTS idx_tasks_user_change_xid ON tasks ("user", change_xid)',
+    'CREATE INDEX IF NOT EXISTS idx_projects_user_change_xid ON projects ("user", change_xid)',
+    'CREATE INDEX IF NOT EXISTS idx_tombstones_user_change_xid ON tombstones ("user", change_xid)',
+    # priority_rank() / due_key() from storage.base, kept current by the
+    # tasks_sort_keys trigger on every insert and every update of priority or due_sort
+    '''
+    CREATE OR REPLACE FUNCTION task_priority_rank(priority TEXT) RETURNS INTEGER AS $$
+        SELECT CASE lower(btrim(COALESCE(priority, 'medium'), E' \\t\\n\\r'))
+            WHEN 'high' THEN 0 WHEN 'low' THEN 2 ELSE 1 END
+    $$ LANGUAGE SQL IMMUTABLE
+    ''',
+    '''
+    CREATE OR REPLACE FUNCTION task_due_key(due_sort TEXT) RETURNS TEXT AS $$
+    DECLARE
+        value TEXT := btrim(COALESCE(due_sort, ''), E' \\t\\n\\r');
+        y INTEGER;
+        m INTEGER;
+        d INTEGER;
+    BEGIN
+        IF value !~ '^[0-9]{4}-[0-9]{2}-[0-9]{2}$' THEN
+            RETURN '';
+        END IF;
+        y := substr(value, 1, 4)::int;
+        m := substr(value, 6, 2)::int;
+        d := substr(value, 9, 2)::int;
+        -- checked by hand rather than with ::date, which raises on '2026-02-30'
+        IF y < 1 OR m NOT BETWEEN 1 AND 12 OR d < 1
+           OR d > extract(day FROM make_date(y, m, 1) + interval '1 month' - interval '1 day') THEN
+            RETURN '';
+        END IF;
+        RETURN value;
+    END
+    $$ LANGUAGE plpgsql IMMUTABLE
+    ''',
+    '''
+    CREATE OR REPLACE FUNCTION stamp_sort_keys() RETURNS TRIGGER AS $$
+    BEGIN
+        NEW.priority_rank := task_priority_rank(NEW.priority);
+        NEW.due_key := task_due_key(NEW.due_sort);
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    # change_xid is the writing transaction's id (xid8 as bigint)
+    '''
+    CREATE OR REPLACE FUNCTION stamp_change_seq() RETURNS TRIGGER AS $$
+    BEGIN
+        NEW.change_seq := nextval('change_seq_seq');
+        NEW.change_xid := pg_current_xact_id()::text::bigint;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    '''
+    CREATE OR REPLACE FUNCTION record_tombstone() RETURNS TRIGGER AS $$
+    BEGIN
+        INSERT INTO tombstones (seq, kind, row_id, "user", change_xid)
+        VALUES (nextval('change_seq_seq'), TG_ARGV[0], OLD.id, OLD."user", pg_current_xact_id()::text::bigint);
+        RETURN OLD;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+]
+
+
+def _create_trigger(name, table, definition):
+    """DDL that creates trigger `name` on `table` only if it isn't there yet."""
+    return f'''
+    DO $$ BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = '{name}' AND tgrelid = '{table}'::regclass) THEN
+            CREATE TRIGGER {name} {definition};
+        END IF;
+    END $$
+    '''
+
+
+SCHEMA.append(_create_trigger('tasks_sort_keys', 'tasks',
+                              'BEFORE INSERT OR UPDATE OF priority, due_sort ON tasks FOR EACH ROW EXECUTE FUNCTION stamp_sort_keys()'))
+for _table, _kind in (('tasks', 'task'), ('projects', 'project')):
+    SCHEMA += [
+        _create_trigger(f'{_table}_change_seq', _table,
+                        f'BEFORE INSERT OR UPDATE ON {_table} FOR EACH ROW EXECUTE FUNCTION stamp_change_seq()'),
+        _create_trigger(f'{_table}_tombstone', _table,
+                        f"AFTER DELETE ON {_table} FOR EACH ROW EXECUTE FUNCTION record_tombstone('{_kind}')"),
+    ]
+
+# serializes init_schema across workers and hosts that boot at the same time
+SCHEMA_LOCK_SQL = "SELECT pg_advisory_xact_lock(hashtext('todolist.init_schema'))"
+
+# Each query reads idx_tasks_user_due_priority (or, for legacy ownerless
+# rows, idx_tasks_unowned_due_priority) in order, with no sort step.
+# Unlike SQLite, PostgreSQL 16 won't merge a UNION ALL of these: the
+# branches' "user" conditions don't count as constants for the index order,
+# so it appends and sorts. The owned and ownerless lists are fetched
+# separately and merged here instead. scripts/check_query_plans.py asserts
+# these plans.
+LIST_TASKS_SQL = 'SELECT * FROM tasks WHERE "user" = %s ORDER BY due_key, priority_rank, id'
+LIST_UNOWNED_TASKS_SQL = 'SELECT * FROM tasks WHERE "user" IS NULL ORDER BY due_key, priority_rank, id'
+UPCOMING_TASKS_SQL = '''SELECT * FROM tasks WHERE "user" = %s AND due_key = %s AND status <> 'done' ORDER BY priority_rank, id'''
+UPCOMING_UNOWNED_TASKS_SQL = '''SELECT * FROM tasks WHERE "user" IS NULL AND due_key = %s AND status <> 'done' ORDER BY priority_rank, id'''
+
+# every transaction at or below this has finished (see the module docstring)
+SYNC_CURSOR_SQL = 'SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint - 1 AS cursor'
+
+
+class PostgresRepository(Repository):
+
+    name = 'postgres'
+
+    def __init__(self, dsn, min_size=1, max_size=10):
+        if psycopg is None:
+            raise RuntimeError('the postgres storage backend needs psycopg and psycopg_pool: pip install "psycopg[binary]" psycopg_pool')
+        self.pool = ConnectionPool(dsn, min_size=min_size, max_size=max_size,
+                                   kwargs={'row_factory': dict_row}, open=True)
+
+    def close(self):
+        self.pool.close()
+
+    def _execute(self, conn, sql, params=()):
+        return conn.execute(sql, params, prepare=True)
+
+    def init_schema(self, users=True, tasks=True):
+        # DDL is run once at startup, so it is not worth preparing.
+        # Both table groups share one database here, so they are always created.
+        # One transaction under an advisory lock: workers booting together
+        # take turns, and every statement is a no-op once the schema exists.
+        with self.pool.connection() as conn:
+            with conn.transaction():
+                conn.execute(SCHEMA_LOCK_SQL)
+                for statement in SCHEMA:
+                    conn.execute(statement)
+
+    # tasks
+
+    def list_tasks(self, user=None, include_unowned=False):
+        with self.pool.connection() as conn:
+            if user and include_unowned:
+                rows = heapq.merge(self._execute(conn, LIST_TASKS_SQL, (user,)).fetchall(),
+                                   self._execute(conn, LIST_UNOWNED_TASKS_SQL).fetchall(),
+                                   key=lambda r: (r['due_key'], r['priority_rank'], r['id']))
+            elif user:
+                rows = self._execute(conn, LIST_TASKS_SQL, (user,)).fetchall()
+            else:
+                rows = self._execute(conn, 'SELECT * FROM tasks ORDER BY due_key, priority_rank, id').fetchall()
+        return [task_row_to_dict(r) for r in rows]
+
+    def task_status_counts(self, user=None):
+        with self.pool.connection() as conn:
+            if user:
+                rows = self._execute(conn, 'SELECT status, COUNT(*) AS cnt FROM tasks WHERE "user" = %s GROUP BY status', (user,)).fetchall()
+            else:
+                rows = self._execute(conn, 'SELECT status, COUNT(*) AS cnt FROM tasks GROUP BY status').fetchall()
+        return {r['status']: r['cnt'] for r in rows}
+
+    def add_task(self, user, project, title, description, priority, due, due_sort):
+        with self.pool.connection() as conn:
+            row = self._execute(
+                conn,
+                # the tasks_sort_keys trigger fills priority_rank and due_key
+                'INSERT INTO tasks (project, title, description, priority, due, due_sort, status, "user") VALUES (%s, %s, %s, %s, %s, %s, %s, %s) RETURNING id',
+                (project, title, description, priority, due, due_sort, 'todo', user)
+            ).fetchone()
+        return row['id']
+
+    def get_task_status(self, task_id, user):
+        with self.pool.connection() as conn:
+            row = self._execute(conn, 'SELECT status FROM tasks WHERE id = %s AND ("user" = %s OR "user" IS NULL)', (task_id, user)).fetchone()
+        return row['status'] if row else None
+
+    def set_task_status(self, task_id, user, status, completed_at=None):
+        with self.pool.connection() as conn:
+            self._execute(conn, 'UPDATE tasks SET status = %s, completed_at = %s WHERE id = %s AND ("user" = %s OR "user" IS NULL)', (status, completed_at, task_id, user))
+
+    def delete_task(self, task_id, user=None):
+        with self.pool.connection() as conn:
+            if user:
+                self._execute(conn, 'DELETE FROM tasks WHERE id = %s AND ("user" = %s OR "user" IS NULL)', (task_id, user))
+            else:
+                self._execute(conn, 'DELETE FROM tasks WHERE id = %s', (task_id,))
+
+    def upcoming_tasks(self, user, day):
+        with self.pool.connection() as conn:
+            rows = heapq.merge(self._execute(conn, UPCOMING_TASKS_SQL, (user, day)).fetchall(),
+                               self._execute(conn, UPCOMING_UNOWNED_TASKS_SQL, (day,)).fetchall(),
+                               key=lambda r: (r['priority_rank'], r['id']))
+        return [task_row_to_dict(r) for r in rows]
+
+    # projects
+
+    def list_projects(self, user):
+        with self.pool.connection() as conn:
+            rows = self._execute(conn, 'SELECT id, name, description, change_seq FROM projects WHERE "user" = %s ORDER BY lower(name)', (user,)).fetchall()
+        return [project_row_to_dict(r) for r in rows]
+
+    def add_project(self, user, name, description):
+        with self.pool.connection() as conn:
+            self._execute(conn, 'INSERT INTO projects ("user", name, description) VALUES (%s, %s, %s) ON CONFLICT ("user", name) DO NOTHING', (user, name, description))
+
+    def delete_project(self, user, project_id=None, name=None):
+        with self.pool.connection() as conn:
+            if project_id is not None:
+                row = self._execute(conn, 'DELETE FROM projects WHERE id = %s AND "user" = %s RETURNING name', (project_id, user)).fetchone()
+                if not row:
+                    return None
+                name = row['name']
+            else:
+                self._execute(conn, 'DELETE FROM projects WHERE name = %s AND "user" = %s', (name, user))
+            self._execute(conn, 'DELETE FROM tasks WHERE project = %s AND ("user" = %s OR "user" IS NULL)', (name, user))
+        return name
+
+    # users
+
+    def get_user(self, email):
+        with self.pool.connection() as conn:
+            return self._execute(conn, 'SELECT id, email, password_hash, first_name FROM users WHERE email = %s', (email,)).fetchone()
+
+    def create_user(self, email, password_hash, first_name, last_name):
+        with self.pool.connection() as conn:
+            self._execute(conn, 'INSERT INTO users (email, password_hash, first_name, last_name) VALUES (%s, %s, %s, %s)', (email, password_hash, first_name, last_name))
+
+    # delta sync
+
+    def current_change_seq(self, user=None):
+        with self.pool.connection() as conn:
+            return self._execute(conn, SYNC_CURSOR_SQL).fetchone()['cursor']
+
+    def load_changes(self, user, since=0):
+        with self.pool.connection() as conn:
+            # one REPEATABLE READ snapshot for the cursor and every query
+            with conn.transaction():
+                conn.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+                cursor = self._execute(conn, SYNC_CURSOR_SQL).fetchone()['cursor']
+                pruned_xid = self._execute(conn, 'SELECT pruned_xid FROM sync_state WHERE id = 1').fetchone()['pruned_xid']
+                reset = needs_reset(since, cursor, pruned_xid)
+                start = 0 if reset else since
+                # same rows as list_tasks(user): legacy ownerless tasks are not synced
+                tasks = [task_row_to_dict(r) for r in self._execute(
+                    conn, 'SELECT * FROM tasks WHERE "user" = %s AND change_xid > %s ORDER BY change_seq', (user, start))]
+                projects = [project_row_to_dict(r) for r in self._execute(
+                    conn, 'SELECT id, name, description, change_seq FROM projects WHERE "user" = %s AND change_xid > %s ORDER BY change_seq', (user, start))]
+                deleted = {'tasks': [], 'projects': []}
+                # a client starting from scratch has nothing to delete
+                if start > 0:
+                    for r in self._execute(conn, 'SELECT kind, row_id FROM tombstones WHERE "user" = %s AND change_xid > %s ORDER BY seq', (user, start)):
+                        deleted[r['kind'] + 's'].append(r['row_id'])
+        return {'since': since, 'cursor': cursor, 'reset': reset, 'tasks': tasks, 'projects': projects, 'deleted': deleted}
+
+    def prune_tombstones(self, older_than_days):
+        with self.pool.connection() as conn:
+            row = self._execute(
+                conn,
+                "SELECT COUNT(*) AS cnt, MAX(change_xid) AS max_xid FROM tombstones WHERE deleted_at < now() - make_interval(days => %s)",
+                (int(older_than_days),)
+            ).fetchone()
+            if not row['cnt']:
+                return 0
+            # cut at one xid so the floor has no holes; newer ones below it go too
+            pruned = self._execute(conn, 'DELETE FROM tombstones WHERE change_xid <= %s', (row['max_xid'],)).rowcount
+            self._execute(conn, 'UPDATE sync_state SET pruned_xid = GREATEST(pruned_xid, %s) WHERE id = 1', (row['max_xid'],))
+        return pruned
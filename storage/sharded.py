@@ -0,0 +1,198 @@
+"""SQLite sharded by user: one file per user (or per hash bucket).
+
+Users never share tasks or projects, so each user's rows can live in their
+own SQLite file and writes from different users don't share a database
+lock. `users` stays in a small central database. Shard connections are
+kept open and bounded by an LRU. How much either part helps depends on
+the host; measure with scripts/bench_shards.py.
+
+Legacy tasks without an owner have no shard: scripts/reshard.py assigns
+them to one user (--unowned-owner) when migrating.
+
+Layout under `shard_dir`:
+
+    users.db                central users table
+    user-<hash>.db          one shard per user (buckets=0, the default)
+    bucket-<n>.db           one shard per hash bucket (buckets=N)
+"""
+from collections import OrderedDict
+import glob
+import hashlib
+import os
+import sqlite3
+import threading
+
+from .base import Repository, due_key, priority_rank
+from .sqlite import SQLiteRepository
+
+
+class _KeepOpenConnection(sqlite3.Connection):
+    """A shard connection shared across calls: close() just ends any open transaction."""
+
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+
+    def really_close(self):
+        super().close()
+
+
+class _ShardRepository(SQLiteRepository):
+
+    def __init__(self, db_path):
+        super().__init__(db_path)
+        self._conn = sqlite3.connect(db_path, factory=_KeepOpenConnection, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def connect(self):
+        return self._conn
+
+    def shutdown(self):
+        with self.lock:
+            self.closed = True
+            self._conn.really_close()
+
+
+def shard_file_name(user, buckets=0):
+    digest = hashlib.sha256((user or '').encode('utf-8')).hexdigest()
+    if buckets:
+        return f'bucket-{int(digest[:8], 16) % buckets:04d}.db'
+    return f'user-{digest[:20]}.db'
+
+
+class ShardedSQLiteRepository(Repository):
+    """Routes each call to the session user's shard; user calls go to the central DB."""
+
+    name = 'sqlite-sharded'
+
+    def __init__(self, shard_dir, central_path=None, buckets=0, max_open=64):
+        self.shard_dir = shard_dir
+        self.buckets = buckets
+        self.max_open = max(1, max_open)
+        self.central = SQLiteRepository(central_path or os.path.join(shard_dir, 'users.db'))
+        self._shards = OrderedDict()
+        self._initialized = set()
+        self._lock = threading.Lock()
+
+    def init_schema(self, users=True, tasks=True):
+        os.makedirs(self.shard_dir, exist_ok=True)
+        if users:
+            self.central.init_schema(tasks=False)
+        # shards are created (and migrated) lazily on first use
+
+    def close(self):
+        with self._lock:
+            shards = list(self._shards.values())
+            self._shards.clear()
+        for shard in shards:
+            shard.shutdown()
+
+    def database_files(self):
+        return [self.central.db_path] + self._existing_shards()
+
+    def shard_path(self, user):
+        return os.path.join(self.shard_dir, shard_file_name(user, self.buckets))
+
+    def _open(self, path):
+        with self._lock:
+            shard = self._shards.get(path)
+            if shard is not None:
+                self._shards.move_to_end(path)
+                return shard
+            shard = _ShardRepository(path)
+            if path not in self._initialized:
+                shard.init_schema(users=False)
+                self._initialized.add(path)
+            self._shards[path] = shard
+            evicted = []
+            while len(self._shards) > self.max_open:
+                evicted.append(self._shards.popitem(last=False)[1])
+        # close outside the router lock so a busy shard doesn't stall other users
+        for old in evicted:
+            old.shutdown()
+        return shard
+
+    def _call(self, path, method, *args, **kwargs):
+        while True:
+            shard = self._open(path)
+            with shard.lock:
+                # evicted between lookup and lock: reopen it
+                if shard.closed:
+                    continue
+                return getattr(shard, method)(*args, **kwargs)
+
+    def _for_user(self, owner, method, *args, **kwargs):
+        if not owner:
+            raise ValueError('sharded storage needs a user to pick a shard')
+        return self._call(self.shard_path(owner), method, *args, **kwargs)
+
+    def _existing_shards(self):
+        return sorted(glob.glob(os.path.join(self.shard_dir, 'user-*.db')) +
+                      glob.glob(os.path.join(self.shard_dir, 'bucket-*.db')))
+
+    # tasks
+
+    def list_tasks(self, user=None, include_unowned=False):
+        if user:
+            return self._for_user(user, 'list_tasks', user=user, include_unowned=include_unowned)
+        tasks = []
+        for path in self._existing_shards():
+            tasks.extend(self._call(path, 'list_tasks'))
+        tasks.sort(key=lambda t: (due_key(t['due_sort']), priority_rank(t['priority']), t['id']))
+        return tasks
+
+    def task_status_counts(self, user=None):
+        if user:
+            return self._for_user(user, 'task_status_counts', user=user)
+        stats = {}
+        for path in self._existing_shards():
+            for status, cnt in self._call(path, 'task_status_counts').items():
+                stats[status] = stats.get(status, 0) + cnt
+        return stats
+
+    def add_task(self, user, project, title, description, priority, due, due_sort):
+        return self._for_user(user, 'add_task', user, project, title, description, priority, due, due_sort)
+
+    def get_task_status(self, task_id, user):
+        return self._for_user(user, 'get_task_status', task_id, user)
+
+    def set_task_status(self, task_id, user, status, completed_at=None):
+        return self._for_user(user, 'set_task_status', task_id, user, status, completed_at)
+
+    def delete_task(self, task_id, user=None):
+        return self._for_user(user, 'delete_task', task_id, user=user)
+
+    def upcoming_tasks(self, user, day):
+        return self._for_user(user, 'upcoming_tasks', user, day)
+
+    # projects
+
+    def list_projects(self, user):
+        return self._for_user(user, 'list_projects', user)
+
+    def add_project(self, user, name, description):
+        return self._for_user(user, 'add_project', user, name, description)
+
+    def delete_project(self, user, project_id=None, name=None):
+        return self._for_user(user, 'delete_project', user, project_id=project_id, name=name)
+
+    # users
+
+    def get_user(self, email):
+        return self.central.get_user(email)
+
+    def create_user(self, email, password_hash, first_name, last_name):
+        return self.central.create_user(email, password_hash, first_name, last_name)
+
+    # delta sync (cursors are per shard; a user only ever reads their own)
+
+    def current_change_seq(self, user=None):
+        return self._for_user(user, 'current_change_seq')
+
+    def load_changes(self, user, since=0):
+        return self._for_user(user, 'load_changes', user, since)
+
+    def prune_tombstones(self, older_than_days):
+        return sum(self._call(path, 'prune_tombstones', older_than_days) for path in self._existing_shards())
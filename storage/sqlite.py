@@ -0,0 +1,407 @@
+"""SQLite implementation of the repository (the default backend)."""
+import sqlite3
+
+from .base import Repository, due_key, needs_reset, priority_rank, project_row_to_dict, task_row_to_dict
+
+# Task list queries are shaped so idx_tasks_user_due_priority returns rows
+# already sorted. Legacy ownerless rows are a second index range merged in
+# with UNION ALL, because "user = ? OR user IS NULL" forces a temp sort.
+# scripts/check_query_plans.py asserts these plans.
+LIST_TASKS_SQL = 'SELECT * FROM tasks WHERE user = ? ORDER BY due_key, priority_rank, id'
+LIST_TASKS_WITH_UNOWNED_SQL = (
+    'SELECT * FROM tasks WHERE user = ? '
+    'UNION ALL SELECT * FROM tasks WHERE user IS NULL '
+    'ORDER BY due_key, priority_rank, id'
+)
+UPCOMING_TASKS_SQL = (
+    "SELECT * FROM tasks WHERE user = ? AND due_key = ? AND status <> 'done' "
+    "UNION ALL SELECT * FROM tasks WHERE user IS NULL AND due_key = ? AND status <> 'done' "
+    "ORDER BY priority_rank, id"
+)
+
+# priority_rank() / due_key() from storage.base as SQL, for the triggers that
+# keep the sort keys current whatever writes the row
+_WHITESPACE = 'char(9, 10, 13, 32)'
+_DUE = f'trim({{row}}.due_sort, {_WHITESPACE})'
+PRIORITY_RANK_SQL = (
+    f"(CASE lower(trim(COALESCE({{row}}.priority, 'medium'), {_WHITESPACE})) "
+    "WHEN 'high' THEN 0 WHEN 'low' THEN 2 ELSE 1 END)"
+)
+# date() alone lets '2026-02-30' through; the julianday() round trip rolls it
+# over. Python's datetime starts at year 1, hence the lower bound.
+DUE_KEY_SQL = f"(CASE WHEN date(julianday({_DUE})) = {_DUE} AND {_DUE} >= '0001' THEN {_DUE} ELSE '' END)"
+
+
+class SQLiteRepository(Repository):
+
+    name = 'sqlite'
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    def database_files(self):
+        return [self.db_path]
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_schema(self, users=True, tasks=True):
+        conn = self.connect()
+        cur = conn.cursor()
+        # auto_vacuum=INCREMENTAL lets the maintenance job hand free pages back
+        # a few at a time. It has to be set before anything writes the file
+        # header (switching to WAL does); existing files keep their mode until
+        # `python maintenance.py enable_auto_vacuum` rebuilds them.
+        cur.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        # WAL lets readers (and online backups) run alongside a writer.
+        cur.execute('PRAGMA journal_mode = WAL').fetchone()
+        if tasks:
+            self._create_task_tables(conn)
+        if users:
+            self._create_user_tables(conn)
+        conn.close()
+
+    def _create_task_tables(self, conn):
+        cur = conn.cursor()
+        cur.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                project TEXT,
+                title TEXT NOT NULL,
+                description TEXT,
+                priority TEXT,
+                due TEXT,
+                due_sort TEXT,
+                status TEXT DEFAULT 'todo'
+            )
+            '''
+        )
+        # projects table to persist project metadata
+        cur.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS projects (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user TEXT NOT NULL,
+                name TEXT NOT NULL,
+                description TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(user, name)
+            )
+            '''
+        )
+        conn.commit()
+        # Add columns missing from older databases (safe on repeated runs)
+        for table, column in (('tasks', 'completed_at'), ('tasks', 'user'), ('projects', 'user')):
+            try:
+                cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} TEXT")
+                conn.commit()
+            except Exception:
+                # column already exists or other issue; ignore
+                pass
+        self._init_sort_keys(conn)
+        self._init_change_tracking(conn)
+
+    def _init_sort_keys(self, conn):
+        """Add the numeric priority_rank / normalized due_key columns, their index and triggers.
+
+        add_task fills both columns itself; the triggers cover every other
+        write (an UPDATE of priority or due_sort, rows inserted elsewhere)
+        and only touch the row when a key is actually stale.
+        """
+        cur = conn.cursor()
+        for column in ("priority_rank INTEGER NOT NULL DEFAULT 1", "due_key TEXT NOT NULL DEFAULT ''"):
+            try:
+                cur.execute(f"ALTER TABLE tasks ADD COLUMN {column}")
+            except Exception:
+                pass
+        rank, due = PRIORITY_RANK_SQL.format(row='NEW'), DUE_KEY_SQL.format(row='NEW')
+        for name, event in (('insert', 'INSERT'), ('update', 'UPDATE OF priority, due_sort')):
+            cur.execute(
+                f'''
+                CREATE TRIGGER IF NOT EXISTS tasks_sort_keys_{name} AFTER {event} ON tasks
+                WHEN NEW.priority_rank IS NOT {rank} OR NEW.due_key IS NOT {due}
+                BEGIN
+                    UPDATE tasks SET priority_rank = {rank}, due_key = {due} WHERE id = NEW.id;
+                END
+                '''
+            )
+        # backfill new columns and repair rows written before the triggers existed
+        rank, due = PRIORITY_RANK_SQL.format(row='tasks'), DUE_KEY_SQL.format(row='tasks')
+        cur.execute(f'UPDATE tasks SET priority_rank = {rank}, due_key = {due} WHERE priority_rank IS NOT {rank} OR due_key IS NOT {due}')
+        cur.execute('CREATE INDEX IF NOT EXISTS idx_tasks_user_due_priority ON tasks (user, due_key, priority_rank, id)')
+        conn.commit()
+
+    def _create_user_tables(self, conn):
+        # users table for authentication
+        cur = conn.cursor()
+        cur.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                email TEXT NOT NULL UNIQUE,
+                password_hash TEXT NOT NULL,
+                first_name TEXT,
+                last_name TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+            '''
+        )
+        conn.commit()
+
+    def _init_change_tracking(self, conn):
+        """Stamp every task/project write with a global change sequence number.
+
+        Triggers keep `change_seq` current on insert/update and record deletes
+        in `tombstones`. SQLite serializes writers, so the counter order is the
+        commit order.
+        """
+        cur = conn.cursor()
+        for table in ('tasks', 'projects'):
+            try:
+                cur.execute(f"ALTER TABLE {table} ADD COLUMN change_seq INTEGER")
+                conn.commit()
+            except Exception:
+                pass
+        cur.execute('CREATE TABLE IF NOT EXISTS change_seq (id INTEGER PRIMARY KEY CHECK (id = 1), seq INTEGER NOT NULL)')
+        cur.execute('INSERT OR IGNORE INTO change_seq (id, seq) VALUES (1, 0)')
+        # highest tombstone seq pruned so far; older cursors must start over
+        try:
+            cur.execute('ALTER TABLE change_seq ADD COLUMN pruned_seq INTEGER NOT NULL DEFAULT 0')
+        except Exception:
+            pass
+        cur.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS tombstones (
+                seq INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL,
+                row_id INTEGER NOT NULL,
+                user TEXT,
+                deleted_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+            '''
+        )
+        cur.execute('CREATE INDEX IF NOT EXISTS idx_tasks_user_change_seq ON tasks (user, change_seq)')
+        cur.execute('CREATE INDEX IF NOT EXISTS idx_projects_user_change_seq ON projects (user, change_seq)')
+        cur.execute('CREATE INDEX IF NOT EXISTS idx_tombstones_user_seq ON tombstones (user, seq)')
+        bump = 'UPDATE change_seq SET seq = seq + 1 WHERE id = 1;'
+        current = '(SELECT seq FROM change_seq WHERE id = 1)'
+        kinds = {'tasks': 'task', 'projects': 'project'}
+        for table, kind in kinds.items():
+            cur.execute(
+                f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_change_seq_insert AFTER INSERT ON {table}
+                BEGIN
+                    {bump}
+                    UPDATE {table} SET change_seq = {current} WHERE id = NEW.id;
+                END
+                '''
+            )
+            # the WHEN guard skips the trigger's own change_seq update
+            cur.execute(
+                f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_change_seq_update AFTER UPDATE ON {table}
+                WHEN NEW.change_seq IS OLD.change_seq
+                BEGIN
+                    {bump}
+                    UPDATE {table} SET change_seq = {current} WHERE id = NEW.id;
+                END
+                '''
+            )
+            cur.execute(
+                f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_change_seq_delete AFTER DELETE ON {table}
+                BEGIN
+                    {bump}
+                    INSERT INTO tombstones (seq, kind, row_id, user) VALUES ({current}, '{kind}', OLD.id, OLD.user);
+                END
+                '''
+            )
+            # backfill rows written before tracking existed (the update trigger stamps them)
+            cur.execute(f'UPDATE {table} SET change_seq = change_seq WHERE change_seq IS NULL')
+        conn.commit()
+
+    # tasks
+
+    def list_tasks(self, user=None, include_unowned=False):
+        conn = self.connect()
+        cur = conn.cursor()
+        if user and include_unowned:
+            cur.execute(LIST_TASKS_WITH_UNOWNED_SQL, (user,))
+        elif user:
+            cur.execute(LIST_TASKS_SQL, (user,))
+        else:
+            cur.execute('SELECT * FROM tasks ORDER BY due_key, priority_rank, id')
+        tasks = [task_row_to_dict(r) for r in cur.fetchall()]
+        conn.close()
+        return tasks
+
+    def task_status_counts(self, user=None):
+        conn = self.connect()
+        cur = conn.cursor()
+        if user:
+            cur.execute("SELECT status, COUNT(*) as cnt FROM tasks WHERE user = ? GROUP BY status", (user,))
+        else:
+            cur.execute("SELECT status, COUNT(*) as cnt FROM tasks GROUP BY status")
+        stats = {r['status']: r['cnt'] for r in cur.fetchall()}
+        conn.close()
+        return stats
+
+    def add_task(self, user, project, title, description, priority, due, due_sort):
+        conn = self.connect()
+        cur = conn.cursor()
+        cur.execute(
+            'INSERT INTO tasks (project, title, description, priority, due, due_sort, status, user, priority_rank, due_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (project, title, description, priority, due, due_sort, 'todo', user, priority_rank(priority), due_key(due_sort))
+        )
+        conn.commit()
+        task_id = cur.lastrowid
+        conn.close()
+        return task_id
+
+    def get_task_status(self, task_id, user):
+        conn = self.connect()
+        cur = conn.cursor()
+        # allow legacy NULL owner tasks
+        cur.execute('SELECT status FROM tasks WHERE id = ? AND (user = ? OR user IS NULL)', (task_id, user))
+        row = cur.fetchone()
+        conn.close()
+        return row['status'] if row else None
+
+    def set_task_status(self, task_id, user, status, completed_at=None):
+        conn = self.connect()
+        cur = conn.cursor()
+        cur.execute('UPDATE tasks SET status = ?, completed_at = ? WHERE id = ? AND (user = ? OR user IS NULL)', (status, completed_at, task_id, user))
+        conn.commit()
+        conn.close()
+
+    def delete_task(self, task_id, user=None):
+        conn = self.connect()
+        cur = conn.cursor()
+        if user:
+            cur.execute('DELETE FROM tasks WHERE id = ? AND (user = ? OR user IS NULL)', (task_id, user))
+        else:
+            cur.execute('DELETE FROM tasks WHERE id = ?', (task_id,))
+        conn.commit()
+        conn.close()
+
+    def upcoming_tasks(self, user, day):
+        conn = self.connect()
+        cur = conn.cursor()
+        try:
+            cur.execute(UPCOMING_TASKS_SQL, (user, day, day))
+            return [task_row_to_dict(r) for r in cur.fetchall()]
+        finally:
+            conn.close()
+
+    # projects
+
+    def list_projects(self, user):
+        conn = self.connect()
+        cur = conn.cursor()
+        cur.execute('SELECT id, name, description, change_seq FROM projects WHERE user = ? ORDER BY name COLLATE NOCASE', (user,))
+        projects = [project_row_to_dict(r) for r in cur.fetchall()]
+        conn.close()
+        return projects
+
+    def add_project(self, user, name, description):
+        conn = self.connect()
+        cur = conn.cursor()
+        try:
+            cur.execute('INSERT OR IGNORE INTO projects (user, name, description) VALUES (?, ?, ?)', (user, name, description))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def delete_project(self, user, project_id=None, name=None):
+        conn = self.connect()
+        cur = conn.cursor()
+        try:
+            if project_id is not None:
+                # get name for cascade deletion of tasks, verify ownership
+                cur.execute('SELECT name FROM projects WHERE id = ? AND user = ?', (project_id, user))
+                row = cur.fetchone()
+                if not row:
+                    return None
+                name = row['name']
+                cur.execute('DELETE FROM projects WHERE id = ? AND user = ?', (project_id, user))
+            else:
+                cur.execute('DELETE FROM projects WHERE name = ? AND user = ?', (name, user))
+            cur.execute('DELETE FROM tasks WHERE project = ? AND (user = ? OR user IS NULL)', (name, user))
+            conn.commit()
+            return name
+        finally:
+            conn.close()
+
+    # users
+
+    def get_user(self, email):
+        conn = self.connect()
+        cur = conn.cursor()
+        cur.execute('SELECT id, email, password_hash, first_name FROM users WHERE email = ?', (email,))
+        row = cur.fetchone()
+        conn.close()
+        return dict(row) if row else None
+
+    def create_user(self, email, password_hash, first_name, last_name):
+        conn = self.connect()
+        cur = conn.cursor()
+        cur.execute('INSERT INTO users (email, password_hash, first_name, last_name) VALUES (?, ?, ?, ?)', (email, password_hash, first_name, last_name))
+        conn.commit()
+        conn.close()
+
+    # delta sync
+
+    def current_change_seq(self, user=None):
+        conn = self.connect()
+        try:
+            row = conn.execute('SELECT seq FROM change_seq WHERE id = 1').fetchone()
+            return row['seq'] if row else 0
+        finally:
+            conn.close()
+
+    def load_changes(self, user, since=0):
+        conn = self.connect()
+        cur = conn.cursor()
+        try:
+            cur.execute('BEGIN')
+            cur.execute('SELECT seq, pruned_seq FROM change_seq WHERE id = 1')
+            row = cur.fetchone()
+            cursor = row['seq']
+            reset = needs_reset(since, cursor, row['pruned_seq'])
+            start = 0 if reset else since
+            # same rows as list_tasks(user): legacy ownerless tasks are not synced
+            cur.execute('SELECT * FROM tasks WHERE user = ? AND change_seq > ? ORDER BY change_seq', (user, start))
+            tasks = [task_row_to_dict(r) for r in cur.fetchall()]
+            cur.execute('SELECT id, name, description, change_seq FROM projects WHERE user = ? AND change_seq > ? ORDER BY change_seq', (user, start))
+            projects = [project_row_to_dict(r) for r in cur.fetchall()]
+            deleted = {'tasks': [], 'projects': []}
+            # a client starting from scratch has nothing to delete
+            if start > 0:
+                cur.execute('SELECT kind, row_id FROM tombstones WHERE user = ? AND seq > ? ORDER BY seq', (user, start))
+                for r in cur.fetchall():
+                    deleted[r['kind'] + 's'].append(r['row_id'])
+            conn.commit()
+        finally:
+            conn.close()
+        return {'since': since, 'cursor': cursor, 'reset': reset, 'tasks': tasks, 'projects': projects, 'deleted': deleted}
+
+    def prune_tombstones(self, older_than_days):
+        conn = self.connect()
+        cur = conn.cursor()
+        try:
+            cur.execute('BEGIN IMMEDIATE')
+            cutoff = f'-{int(older_than_days)} days'
+            cur.execute("SELECT COUNT(*) AS cnt, MAX(seq) AS max_seq FROM tombstones WHERE deleted_at < datetime('now', ?)", (cutoff,))
+            row = cur.fetchone()
+            pruned = 0
+            if row['cnt']:
+                # seq grows with time, so this removes exactly the expired prefix
+                pruned = cur.execute('DELETE FROM tombstones WHERE seq <= ?', (row['max_seq'],)).rowcount
+                cur.execute('UPDATE change_seq SET pruned_seq = MAX(pruned_seq, ?) WHERE id = 1', (row['max_seq'],))
+            conn.commit()
+            return pruned
+        finally:
+            conn.close()